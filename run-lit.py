@@ -3,17 +3,23 @@
 from __future__ import print_function
 
 import argparse
+import json
 import os.path
 import sys
 
 import pkg_resources as pkgres
 
+from yalpt import chunks
 from yalpt import core
+from yalpt import events
+from yalpt import server
+from yalpt import shard
 
 
 parser = argparse.ArgumentParser()
 parser.formatter_class = argparse.RawDescriptionHelpFormatter
-parser.usage = "%(prog)s [OPTION]... file"
+parser.usage = ("%(prog)s [OPTION]... file\n"
+                "       %(prog)s --merge-shards REPORT...")
 parser.description = "Yet Another Literate Python Tool"
 parser.epilog = """
 
@@ -39,7 +45,7 @@ with a built-in formatter that renders a subset of Markdown
 with ANSI escape codes, so it looks nice in your terminal.
 """
 
-parser.add_argument('file',
+parser.add_argument('file', nargs='?',
                     help='The YALPT literate python file to run')
 parser.add_argument('--no-pause', action='store_false', dest='pause',
                     default=True,
@@ -69,9 +75,138 @@ parser.add_argument('-e, --env-driver', dest='env_driver', default=None,
                     help="Use the given env driver to set up the environment"
                          "in which the code executes.  Use [] to pass a "
                          "parameter.")
+parser.add_argument('-s', '--start-at', dest='start_at', default=None,
+                    help="Skip ahead to the given chunk number or section "
+                         "heading before running anything.  Code before "
+                         "that point is not executed.")
+parser.add_argument('--check', action='store_true', default=False,
+                    help="Just check every code block for syntax errors "
+                         "and malformed expected output, without running "
+                         "anything.  Exits with a non-zero status if "
+                         "problems were found.")
+parser.add_argument('--no-precheck', dest='precheck', action='store_false',
+                    default=True,
+                    help="Don't check every code block for syntax errors "
+                         "before starting")
+parser.add_argument('--asyncio', dest='use_asyncio', action='store_true',
+                    default=False,
+                    help="Allow top-level 'await' in code blocks, and run "
+                         "all code on a single persistent asyncio event "
+                         "loop (requires Python 3.8+)")
+parser.add_argument('-k', '--kernel', dest='use_kernel', action='store_true',
+                    default=False,
+                    help="Run the code in a separate kernel process, so "
+                         "that a crash doesn't take down the whole session.  "
+                         "Values set up by the env driver must be picklable.")
+parser.add_argument('--render-ahead', dest='render_ahead', type=int,
+                    default=2, metavar='N',
+                    help="Format up to N upcoming text blocks in the "
+                         "background while waiting on code or input "
+                         "(0 disables the background thread)")
+parser.add_argument('--events', dest='events', default=None,
+                    metavar='TARGET',
+                    help="Write a stream of per-chunk events as JSON lines "
+                         "to TARGET, which may be a file path, 'fd:N' or "
+                         "'unix:SOCKET_PATH'")
+parser.add_argument('--profile-imports', dest='profile_imports',
+                    action='store_true', default=False,
+                    help="Time the modules imported by each code block, "
+                         "and print a report at the end of the file")
+parser.add_argument('--capture-fds', dest='capture_fds', action='store_true',
+                    default=False,
+                    help="Also capture output written directly to the "
+                         "stdout and stderr file descriptors, e.g. by C "
+                         "extensions and subprocesses (POSIX only; pdb "
+                         "output is captured as well)")
+parser.add_argument('--max-output-lines', dest='max_output_lines', type=int,
+                    default=None, metavar='N',
+                    help="Only show the first and last few lines of code "
+                         "block output longer than N lines.  Enter '!more' "
+                         "at the prompt to page through the full output.")
+parser.add_argument('--max-output-chars', dest='max_output_chars', type=int,
+                    default=None, metavar='N',
+                    help="Only show the start and end of code block output "
+                         "longer than N characters")
+parser.add_argument('--serve', dest='serve', default=None, metavar='ADDRESS',
+                    help="Serve the file to many people at once on ADDRESS "
+                         "(a Unix socket path, or HOST:PORT), giving each "
+                         "connection its own session.  The file is parsed "
+                         "and formatted, and the env driver set up, only "
+                         "once.  Implies --no-readline.")
+parser.add_argument('--serve-remote', dest='serve_remote',
+                    action='store_true', default=False,
+                    help="Allow --serve to listen on a non-loopback TCP "
+                         "address.  DANGEROUS: every session is an "
+                         "unauthenticated Python shell running as you, "
+                         "open to anyone who can reach the port.")
+parser.add_argument('--max-sessions', dest='max_sessions', type=int,
+                    default=10, metavar='N',
+                    help="The maximum number of concurrent sessions when "
+                         "using --serve")
+parser.add_argument('--history-size', dest='history_size', type=int,
+                    default=1000, metavar='N',
+                    help="Keep at most N entries of readline history")
+parser.add_argument('--no-echo-history', dest='history_echoed',
+                    action='store_false', default=True,
+                    help="Don't add the lines of each code block to the "
+                         "readline history, just the ones you type")
+parser.add_argument('--shard', dest='shard', default=None, metavar='I/N',
+                    help="Split the file into N parts at text block "
+                         "boundaries, and just run and check part I "
+                         "without pausing, replaying the code of the "
+                         "earlier parts first.  Writes a JSON report, and "
+                         "exits with a non-zero status if anything failed.")
+parser.add_argument('--shard-replay', dest='shard_replay', default='auto',
+                    choices=shard.REPLAY_MODES,
+                    help="Which earlier code blocks to replay with --shard: "
+                         "'all' of them, just the ones marked with a "
+                         "'# yalpt: setup' comment, or 'auto' (the marked "
+                         "ones if there are any)")
+parser.add_argument('--shard-report', dest='shard_report', default=None,
+                    metavar='FILE',
+                    help="Write the --shard report to FILE instead of "
+                         "stdout")
+parser.add_argument('--merge-shards', dest='merge_shards', nargs='+',
+                    default=None, metavar='REPORT',
+                    help="Combine the reports from every --shard run of a "
+                         "file, and exit with a non-zero status if any "
+                         "shard failed or any are missing")
 
 args = parser.parse_args()
 
+if args.merge_shards:
+    reports = []
+    for report_path in args.merge_shards:
+        try:
+            with open(report_path) as f:
+                reports.append(json.load(f))
+        except (IOError, OSError, ValueError) as ex:
+            sys.exit("Error: cannot read shard report %s: %s" %
+                     (report_path, ex))
+
+    try:
+        merged = shard.merge_reports(reports)
+    except (shard.ShardError, KeyError) as ex:
+        sys.exit("Error: cannot merge shard reports: %s" % ex)
+
+    for lineno, msg in merged['problems']:
+        print("%s:%s: %s" % (merged['name'], lineno, msg), file=sys.stderr)
+    for res in merged['results']:
+        if res['status'] not in ('pass', 'ok'):
+            print("%s:%s: chunk %s %s" % (merged['name'], res['lineno'],
+                                          res['chunk'], res['status']),
+                  file=sys.stderr)
+
+    counts = ', '.join('%s %s' % (num, status) for status, num
+                       in sorted(merged['statuses'].items()))
+    print("%s: %s across %s shard(s) -- %s" %
+          (merged['name'], counts or 'no code blocks', merged['shards'],
+           'PASSED' if merged['passed'] else 'FAILED'))
+    sys.exit(0 if merged['passed'] else 1)
+
+if args.file is None:
+    parser.error("a file to run is required")
+
 filename = os.path.basename(args.file)
 
 # code parser
@@ -132,11 +267,98 @@ if args.env_driver:
                  "env driver found" % args.env_driver)
         env_driver = None
 
+event_stream = None
+if args.events:
+    try:
+        event_stream = events.EventStream(args.events)
+    except (IOError, OSError, ValueError) as ex:
+        sys.exit("Error: cannot open event stream %s: %s" % (args.events, ex))
+
+if args.use_asyncio and args.use_kernel:
+    sys.exit("Error: --asyncio cannot be used with --kernel")
+
+if args.profile_imports and args.use_kernel:
+    sys.exit("Error: --profile-imports cannot be used with --kernel")
+
+if args.capture_fds and args.use_kernel:
+    sys.exit("Error: --capture-fds cannot be used with --kernel")
+
+if args.shard:
+    try:
+        args.shard = shard.parse_shard(args.shard)
+    except shard.ShardError as ex:
+        sys.exit("Error: %s" % ex)
+
+    if args.serve or args.check or args.start_at:
+        sys.exit("Error: --shard cannot be used with --serve, --check "
+                 "or --start-at")
+
+    # shards run unattended
+    args.pause = args.interactive = args.readline = False
+
+if args.serve:
+    # sessions don't have a terminal to use readline with
+    args.readline = False
+
 interpreter = core.LiterateInterpreter(text_formatter=text_formatter,
                                        code_parser=code_parser,
                                        use_ansi=args.ansi,
                                        use_readline=args.readline,
-                                       env_driver=env_driver)
+                                       env_driver=env_driver,
+                                       use_asyncio=args.use_asyncio,
+                                       use_kernel=args.use_kernel,
+                                       render_ahead=args.render_ahead,
+                                       events=event_stream,
+                                       profile_imports=args.profile_imports,
+                                       capture_fds=args.capture_fds,
+                                       max_output_lines=args.max_output_lines,
+                                       max_output_chars=args.max_output_chars,
+                                       history_size=args.history_size,
+                                       history_echoed=args.history_echoed)
 with open(args.file) as f:
-    interpreter.interact(f.read(), filename,
-                         pause=args.pause, interactive=args.interactive)
+    lit_string = f.read()
+
+if args.check:
+    problems = interpreter.check(lit_string, filename)
+    for problem in problems:
+        print(interpreter.format_problem(problem), file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+try:
+    if args.shard:
+        shard_ind, shard_count = args.shard
+        report = shard.run_shard(interpreter, lit_string, filename,
+                                 shard_ind, shard_count,
+                                 replay=args.shard_replay)
+        report_text = json.dumps(report, indent=2, sort_keys=True)
+        if args.shard_report:
+            with open(args.shard_report, 'w') as f:
+                f.write(report_text + '\n')
+        else:
+            print(report_text)
+        sys.exit(0 if report['passed'] else 1)
+    elif args.serve:
+        try:
+            tutorial_server = server.TutorialServer(
+                interpreter, lit_string, filename,
+                server.parse_address(args.serve),
+                max_sessions=args.max_sessions, pause=args.pause,
+                interactive=args.interactive, start_at=args.start_at,
+                allow_remote=args.serve_remote)
+        except ValueError as ex:
+            sys.exit("Error: cannot serve on %s: %s (see --serve-remote)" %
+                     (args.serve, ex))
+
+        try:
+            tutorial_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        interpreter.interact(lit_string, filename,
+                             pause=args.pause, interactive=args.interactive,
+                             start_at=args.start_at, precheck=args.precheck)
+except chunks.ChunkNotFound:
+    sys.exit("Error: no chunk or section matching %s" % args.start_at)
+finally:
+    if event_stream is not None:
+        event_stream.close()
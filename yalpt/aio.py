@@ -0,0 +1,154 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+# NB: this module uses Python 3.8+ syntax and APIs, so it's only imported
+# when asyncio support is requested
+import ast
+import asyncio
+import concurrent.futures
+import ctypes
+import inspect
+import threading
+import types
+
+
+__all__ = ["EventLoopThread", "COMPILE_FLAGS"]
+
+
+COMPILE_FLAGS = ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+
+
+class EventLoopThread(object):
+    # Runs a single event loop on a background thread for the lifetime of
+    # a literate program.  Code is run on the loop thread (much like
+    # `python -m asyncio` does), so tasks created in one chunk keep running
+    # while later chunks execute and while the console is waiting for input.
+    #
+    # Since ^C is delivered to the main thread, run() passes it along to
+    # the code on the loop thread: code that's running gets a
+    # KeyboardInterrupt raised in it, and code that's waiting on something
+    # gets cancelled.
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._task = None
+        self._interrupted = False
+
+    def start(self):
+        if self.loop is not None:
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop,
+                                        name='yalpt-event-loop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        while True:
+            try:
+                self.loop.run_forever()
+                return
+            except BaseException:
+                # e.g. an interrupt meant for the code which arrived just
+                # after it had stopped running, or a background task calling
+                # sys.exit() -- anything waiting on the loop would hang if
+                # it died, so keep it going
+                continue
+
+    async def _run_code(self, code_obj, globs, on_error):
+        self._task = asyncio.current_task()
+        try:
+            if self._interrupted:
+                raise KeyboardInterrupt
+
+            res = types.FunctionType(code_obj, globs)()
+            if inspect.iscoroutine(res):
+                await res
+        except asyncio.CancelledError:
+            if not self._interrupted:
+                raise
+
+            # interrupted while waiting on something
+            try:
+                raise KeyboardInterrupt
+            except KeyboardInterrupt:
+                on_error()
+        except SystemExit as ex:
+            # raising it here would take down the loop -- let run() raise
+            # it on the main thread instead
+            return ex
+        except BaseException:
+            on_error()
+        finally:
+            self._task = None
+
+    def _interrupt(self):
+        self._interrupted = True
+
+        task = self._task
+        if task is None:
+            # the code hasn't started yet (see _run_code)
+            return
+
+        if asyncio.current_task(self.loop) is task:
+            # the code is running right now, so raise
+            # KeyboardInterrupt in the loop thread
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_ulong(self._thread.ident),
+                ctypes.py_object(KeyboardInterrupt))
+        else:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def run(self, code_obj, globs, on_error):
+        self.start()
+        self._interrupted = False
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_code(code_obj, globs, on_error), self.loop)
+
+        while True:
+            try:
+                res = future.result(0.1)
+            except concurrent.futures.TimeoutError:
+                if not self._thread.is_alive():
+                    raise RuntimeError('the event loop thread died')
+                continue
+            except KeyboardInterrupt:
+                self._interrupt()
+                continue
+
+            if isinstance(res, SystemExit):
+                raise res
+            return
+
+    async def _cancel_tasks(self):
+        tasks = [task for task in asyncio.all_tasks()
+                 if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self, timeout=5):
+        if self.loop is None:
+            return
+
+        if not self._thread.is_alive():
+            self.loop = None
+            self._thread = None
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_tasks(),
+                                             self.loop).result(timeout)
+        except concurrent.futures.TimeoutError:
+            # some task is ignoring cancellation -- stop the loop anyway
+            pass
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self.loop.close()
+
+            self.loop = None
+            self._thread = None
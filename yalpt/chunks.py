@@ -0,0 +1,137 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import array
+import re
+
+import six
+
+from yalpt import parsers
+
+
+__all__ = ["ChunkStore", "ChunkNotFound"]
+
+
+class ChunkNotFound(KeyError):
+    pass
+
+
+class ChunkStore(object):
+    # All chunk text (prose, code source, expected output and expected
+    # exception messages) lives in a single string buffer, and the per-chunk
+    # metadata lives in flat integer arrays.  Chunks are only turned back
+    # into strings or CodeChunk objects when they are accessed, so jumping
+    # to a given chunk or heading doesn't build objects for the rest of
+    # the document.
+
+    # per-chunk record layout in self._fields
+    _STRIDE = 8
+    (_SRC_START, _SRC_LEN, _WANT_START, _WANT_LEN,
+     _EXC_START, _EXC_LEN, _LINENO, _INDENT) = range(_STRIDE)
+
+    _TEXT = 0
+    _CODE = 1
+
+    HEADER_RE1 = re.compile(r'^#+ (?P<name>.+?)(?: #+)?$', re.MULTILINE)
+    HEADER_RE2 = re.compile(r'^(?P<name>[^\n]*\S[^\n]*)\n(?:==+|--+)$',
+                            re.MULTILINE)
+
+    def __init__(self, chunks):
+        self._kinds = array.array('b')
+        self._fields = array.array('l')
+        self.sections = []
+
+        buff = []
+        buff_len = [0]
+
+        def add(s):
+            if s is None:
+                return (0, -1)
+
+            start = buff_len[0]
+            buff.append(s)
+            buff_len[0] += len(s)
+            return (start, len(s))
+
+        for chunk in chunks:
+            if isinstance(chunk, parsers.CodeChunk):
+                self._kinds.append(self._CODE)
+                self._fields.extend(add(chunk.source) + add(chunk.want) +
+                                    add(chunk.exc_msg))
+                self._fields.append(-1 if chunk.lineno is None
+                                    else chunk.lineno)
+                self._fields.append(chunk.indent)
+            else:
+                self._index_headings(chunk, len(self._kinds))
+                self._kinds.append(self._TEXT)
+                self._fields.extend(add(chunk))
+                self._fields.extend((0, -1, 0, -1, -1, 0))
+
+        self._buff = ''.join(buff)
+
+    def _index_headings(self, text, chunk_ind):
+        headings = []
+        for regex in (self.HEADER_RE1, self.HEADER_RE2):
+            for match in regex.finditer(text):
+                headings.append((match.start(), match.group('name').strip()))
+
+        headings.sort()
+        self.sections.extend((name, chunk_ind) for _, name in headings)
+
+    def _slice(self, start, length):
+        if length < 0:
+            return None
+
+        return self._buff[start:start + length]
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def __iter__(self):
+        for chunk_ind in six.moves.range(len(self)):
+            yield self[chunk_ind]
+
+    def __getitem__(self, chunk_ind):
+        if chunk_ind < 0:
+            chunk_ind += len(self)
+        if not 0 <= chunk_ind < len(self):
+            raise IndexError('chunk index out of range')
+
+        base = chunk_ind * self._STRIDE
+        fields = self._fields[base:base + self._STRIDE]
+        source = self._slice(fields[self._SRC_START], fields[self._SRC_LEN])
+
+        if self._kinds[chunk_ind] == self._TEXT:
+            return source
+
+        lineno = fields[self._LINENO]
+        return parsers.CodeChunk(source, source,
+                                 self._slice(fields[self._WANT_START],
+                                             fields[self._WANT_LEN]),
+                                 self._slice(fields[self._EXC_START],
+                                             fields[self._EXC_LEN]),
+                                 None if lineno < 0 else lineno,
+                                 fields[self._INDENT])
+
+    def is_code(self, chunk_ind):
+        return self._kinds[chunk_ind] == self._CODE
+
+    def find(self, target):
+        # headings are matched case-insensitively, first by exact title
+        # and then by prefix
+        if isinstance(target, six.integer_types):
+            if not 0 <= target < len(self):
+                raise ChunkNotFound(target)
+            return target
+
+        if target.isdigit():
+            return self.find(int(target))
+
+        wanted = target.strip().lower()
+        for name, chunk_ind in self.sections:
+            if name.lower() == wanted:
+                return chunk_ind
+
+        for name, chunk_ind in self.sections:
+            if name.lower().startswith(wanted):
+                return chunk_ind
+
+        raise ChunkNotFound(target)
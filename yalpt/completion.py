@@ -0,0 +1,160 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import bisect
+import inspect
+import keyword
+import re
+import types
+
+import six
+from six.moves import builtins
+
+
+__all__ = ["Completer"]
+
+
+_MISSING = object()
+
+# descriptors which are safe to trigger while looking up attributes
+_SAFE_DESCRIPTORS = (types.FunctionType, types.BuiltinFunctionType,
+                     types.MethodType, staticmethod, classmethod,
+                     type(str.join), type(object.__init__),
+                     type(dict.__dict__['fromkeys']))
+
+
+def _safe_getattr(obj, name):
+    # look up an attribute without running arbitrary code (properties,
+    # __getattr__ on proxy objects, etc), returning _MISSING if that's
+    # not possible
+    getattr_static = getattr(inspect, 'getattr_static', None)
+    if getattr_static is None:
+        # Python 2 -- only modules are known to be safe
+        if isinstance(obj, types.ModuleType):
+            return getattr(obj, name, _MISSING)
+        return _MISSING
+
+    try:
+        static_val = getattr_static(obj, name)
+    except AttributeError:
+        return _MISSING
+
+    if not hasattr(type(static_val), '__get__'):
+        return static_val
+    elif isinstance(static_val, _SAFE_DESCRIPTORS):
+        return getattr(obj, name, _MISSING)
+    else:
+        return _MISSING
+
+
+class Completer(object):
+    # A readline completer which, unlike rlcompleter, keeps a sorted index
+    # of the names in the namespace (and of the attributes of objects it
+    # has completed on) until invalidate() is called, and which never
+    # evaluates anything but plain attribute lookups to find an object.
+
+    ATTR_RE = re.compile(r'^(?P<expr>\w+(?:\.\w+)*)\.(?P<attr>\w*)$')
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._names = None
+        self._display = None
+        self._attrs = {}
+        self._matches = []
+
+    def invalidate(self):
+        self._names = None
+        self._display = None
+        self._attrs.clear()
+
+    def complete(self, text, state):
+        if state == 0:
+            if not text.strip():
+                # let people indent with tab
+                self._matches = ['\t']
+            else:
+                try:
+                    self._matches = self._find_matches(text)
+                except Exception:
+                    self._matches = []
+
+        try:
+            return self._matches[state]
+        except IndexError:
+            return None
+
+    @staticmethod
+    def _with_prefix(names, prefix):
+        res = []
+        for ind in six.moves.range(bisect.bisect_left(names, prefix),
+                                   len(names)):
+            if not names[ind].startswith(prefix):
+                break
+            res.append(names[ind])
+
+        return res
+
+    def _build_index(self):
+        # see rlcompleter.Completer.global_matches
+        display = {}
+        for nspace in (builtins.__dict__, self.namespace):
+            for name, val in list(nspace.items()):
+                if callable(val):
+                    display[name] = name + '('
+                else:
+                    display[name] = name
+
+        for word in keyword.kwlist:
+            if word in ('finally', 'try'):
+                display[word] = word + ':'
+            elif word not in ('False', 'None', 'True', 'break', 'continue',
+                              'pass', 'else'):
+                display[word] = word + ' '
+            else:
+                display[word] = word
+
+        display.pop('__builtins__', None)
+        self._display = display
+        self._names = sorted(display)
+
+    def _attr_names(self, obj):
+        cached = self._attrs.get(id(obj))
+        if cached is None or cached[0] is not obj:
+            try:
+                names = sorted(set(dir(obj)))
+            except Exception:
+                names = []
+
+            # NB: keep a reference to obj, so the id stays valid
+            cached = self._attrs[id(obj)] = (obj, names)
+
+        return cached[1]
+
+    def _find_matches(self, text):
+        match = self.ATTR_RE.match(text)
+        if match is None:
+            if self._names is None:
+                self._build_index()
+
+            return [self._display[name]
+                    for name in self._with_prefix(self._names, text)]
+
+        parts = match.group('expr').split('.')
+        obj = self.namespace.get(parts[0], _MISSING)
+        if obj is _MISSING:
+            obj = getattr(builtins, parts[0], _MISSING)
+
+        for part in parts[1:]:
+            if obj is _MISSING:
+                break
+            obj = _safe_getattr(obj, part)
+
+        if obj is _MISSING:
+            return []
+
+        attr = match.group('attr')
+        names = self._with_prefix(self._attr_names(obj), attr)
+        if not attr.startswith('_'):
+            # like rlcompleter, hide private names unless asked for them
+            names = [name for name in names if not name.startswith('_')]
+
+        return ['{0}.{1}'.format(match.group('expr'), name)
+                for name in names]
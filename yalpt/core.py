@@ -8,7 +8,9 @@ import contextlib
 import doctest
 import getpass
 import linecache
+import os
 import pdb
+import pydoc
 import re
 import sys
 import traceback
@@ -17,8 +19,15 @@ import warnings
 import six
 
 from yalpt import ansi_helper as ansi
+from yalpt import chunks
+from yalpt import completion
 from yalpt import formatters
+from yalpt import history
+from yalpt import importprof
+from yalpt import kernel
 from yalpt import parsers
+from yalpt import render
+from yalpt import util
 
 
 __all__ = ["LiterateInterpreter"]
@@ -32,12 +41,37 @@ def noop_mgr(writer):
 class LiterateInterpreter(code.InteractiveConsole):
     def __init__(self, text_formatter=formatters.NoopFormatter(),
                  code_parser=parsers.DocTestParser(), use_ansi=True,
-                 use_readline=True, env_driver=None, *args, **kwargs):
+                 use_readline=True, env_driver=None, use_asyncio=False,
+                 use_kernel=False, render_ahead=2, events=None,
+                 profile_imports=False, capture_fds=False,
+                 max_output_lines=None, max_output_chars=None,
+                 history_file=None, history_size=1000, history_echoed=True,
+                 *args, **kwargs):
+        if use_asyncio and use_kernel:
+            raise ValueError('asyncio support is not available when '
+                             'running code in a kernel process')
+
+        if profile_imports and use_kernel:
+            raise ValueError('imports cannot be profiled when running code '
+                             'in a kernel process')
+
+        if capture_fds and use_kernel:
+            raise ValueError('file descriptors cannot be captured when '
+                             'running code in a kernel process')
+
+        # NB: InteractiveConsole.__init__ calls resetbuffer
+        self._kernel = None
         code.InteractiveConsole.__init__(self, *args, **kwargs)
 
         self._output_checker = doctest.OutputChecker()
-        self._fakeout = doctest._SpoofOut()
+        if capture_fds:
+            from yalpt import fdcapture
+            self._fakeout = fdcapture.FDCapture()
+        else:
+            self._fakeout = doctest._SpoofOut()
+        self.capture_fds = capture_fds
         self.chunks = None
+        self.results = []
         self.exc_msg = None
         self.name = 'literate program'
         self.text_formatter = text_formatter
@@ -45,17 +79,123 @@ class LiterateInterpreter(code.InteractiveConsole):
         self.use_ansi = use_ansi
         self.pause = True
         self.interactive = True
+        self.compile_flags = 0
+        self._event_loop = None
+        self._renderer = render.LookaheadRenderer(render_ahead)
+        self.events = events
+        self.max_output_lines = max_output_lines
+        self.max_output_chars = max_output_chars
+        self._full_outputs = {}
+        self._last_truncated = None
+
+        if profile_imports:
+            self.import_profiler = importprof.ImportProfiler()
+        else:
+            self.import_profiler = None
+        self._import_label = None
 
+        self._completer = None
+        self._history = None
+        self.history_echoed = history_echoed
         if use_readline:
             self._readline = __import__('readline')
-            self._add_readline()
+            self._add_readline(history_file, history_size)
         else:
             self._readline = None
 
         self._env_driver = env_driver
+        self._env_started = False
 
         self._correct_path()
 
+        if use_kernel:
+            self._kernel = kernel.Kernel()
+
+        # NB: set this up last, so that the setup code above doesn't
+        # end up starting the event loop
+        if use_asyncio:
+            if sys.version_info < (3, 8):
+                raise ValueError('asyncio support requires Python 3.8 '
+                                 'or newer')
+
+            from yalpt import aio
+            self._event_loop = aio.EventLoopThread()
+            self.compile_flags |= aio.COMPILE_FLAGS
+            self.compile.compiler.flags |= aio.COMPILE_FLAGS
+
+    def runcode(self, code_obj):
+        if self._event_loop is None:
+            return code.InteractiveConsole.runcode(self, code_obj)
+
+        try:
+            self._event_loop.run(code_obj, self.locals, self.showtraceback)
+        except SystemExit:
+            raise
+        except:  # noqa
+            self.showtraceback()
+
+    def push(self, line):
+        if self._kernel is None:
+            more = code.InteractiveConsole.push(self, line)
+        else:
+            try:
+                more, self.exc_msg = self._kernel.push(
+                    self.filename, line, self._write_kernel_output,
+                    self._renderer.prerender_one)
+            except kernel.KernelDiedError as ex:
+                self._report_kernel_death(ex)
+                more = False
+
+        # the namespace may have changed
+        if self._completer is not None and not more:
+            self._completer.invalidate()
+
+        return more
+
+    def resetbuffer(self):
+        code.InteractiveConsole.resetbuffer(self)
+        if self._kernel is not None:
+            self._kernel.reset()
+
+    def _write_kernel_output(self, stream, text):
+        if stream == 'stdout':
+            sys.stdout.write(text)
+        else:
+            self.write(text)
+
+    def _report_kernel_death(self, ex):
+        msg = ('{0} -- restarting it.  Anything defined by earlier code '
+               'has been lost.\n'.format(ex))
+        # make sure this shows up as an unexpected exception
+        self.exc_msg = 'KernelDiedError: {0}\n'.format(ex)
+
+        if self.use_ansi:
+            mgr = ansi.BoxMaker(self)
+        else:
+            mgr = noop_mgr(self)
+
+        self.write('\n')
+        with mgr as maker:
+            maker.write('Warning, the kernel died:\n')
+            maker.write('=========================\n\n')
+            maker.write(msg)
+        self.write('\n')
+
+    def restart_kernel(self):
+        if self._kernel is None:
+            raise ValueError('not running code in a kernel process')
+
+        self._kernel.restart()
+
+    def _update_locals(self, new_locals):
+        self.locals.update(new_locals)
+
+        if self._kernel is not None:
+            skipped = self._kernel.update(new_locals)
+            if skipped:
+                self.write('Warning: the following names could not be sent '
+                           'to the kernel: {0}\n'.format(', '.join(skipped)))
+
     def runfunction(self, func):
         self.runcode(six.get_function_code(func))
 
@@ -68,36 +208,22 @@ class LiterateInterpreter(code.InteractiveConsole):
 
         self.runfunction(correct_path)
 
-    def _add_readline(self):
-        self.locals['__console_locals__'] = self.locals
-        self.locals['readline'] = self._readline
-
-        def add_readline():
-            # add support for completion
-            import atexit
-            import os
-            import readline
-            import rlcompleter
-
-            completer = rlcompleter.Completer(__console_locals__)  # noqa
-            readline.set_completer(completer.complete)
-
-            # tab completion
-            readline.parse_and_bind('Control-space: complete')
-            # history file
-            histfile = os.path.join(os.environ['HOME'],
-                                    '.literate-python-history')
-            try:
-                readline.read_history_file(histfile)
-            except IOError:
-                pass
-            atexit.register(readline.write_history_file, histfile)
-            del os, histfile, readline, rlcompleter
+    def _add_readline(self, history_file, history_size):
+        # add support for completion
+        self._completer = completion.Completer(self.locals)
+        self._readline.set_completer(self._completer.complete)
+
+        # tab completion
+        self._readline.parse_and_bind('Control-space: complete')
 
-        self.runfunction(add_readline)
+        # history file
+        if history_file is None:
+            history_file = os.path.join(os.path.expanduser('~'),
+                                        '.literate-python-history')
 
-        del self.locals['__console_locals__']
-        del self.locals['readline']
+        self._history = history.History(self._readline, history_file,
+                                        history_size)
+        self._history.load()
 
     def _interact_once(self, more):
         try:
@@ -119,7 +245,15 @@ class LiterateInterpreter(code.InteractiveConsole):
                     blank = True
                 else:
                     blank = False
-                more = self.push(line)
+
+                if self._history is not None:
+                    # readline has already added it to the in-memory history
+                    self._history.add(line, to_readline=False)
+
+                if not more and line.split(None, 1)[:1] == ['!more']:
+                    self._page_output(line.split(None, 1)[1:])
+                else:
+                    more = self.push(line)
         except KeyboardInterrupt:
             self.write("\nKeyboardInterrupt\n")
             self.resetbuffer()
@@ -140,7 +274,7 @@ class LiterateInterpreter(code.InteractiveConsole):
         if m and m.group('name') == self.name:
             chunk = self.chunks[int(m.group('chunknum'))]
             source = chunk.source
-            if isinstance(source, six.text_type):
+            if six.PY2 and isinstance(source, six.text_type):
                 source = source.encode('ascii', 'backslashreplace')
             return source.splitlines(True)
         else:
@@ -161,8 +295,15 @@ class LiterateInterpreter(code.InteractiveConsole):
         save_displayhook = sys.displayhook
         sys.displayhook = sys.__displayhook__
 
+        # also grab output written directly to the stdout/stderr fds
+        if self.capture_fds:
+            fd_mgr = self._fakeout.redirect()
+        else:
+            fd_mgr = noop_mgr(None)
+
         try:
-            yield sys.stdout
+            with fd_mgr:
+                yield sys.stdout
         finally:
             sys.stdout = save_stdout
             pdb.set_trace = save_set_trace
@@ -171,8 +312,8 @@ class LiterateInterpreter(code.InteractiveConsole):
     # END FROM PYTHON STD LIB
 
     def _process_code_line(self, line, res, more):
-        if self._readline is not None:
-            self._readline.add_history(line)
+        if self._history is not None and self.history_echoed:
+            self._history.add(line)
 
         if more:
             self.write(sys.ps2)
@@ -185,8 +326,15 @@ class LiterateInterpreter(code.InteractiveConsole):
             self.write(line)
 
         self.write("\n")
+        # only profile the user's code, not our own setup
+        if self.import_profiler is not None:
+            profile_mgr = self.import_profiler.profile(self._import_label)
+        else:
+            profile_mgr = noop_mgr(None)
+
         with self._capture_output() as output:
-            more = self.push(line)
+            with profile_mgr:
+                more = self.push(line)
 
             res += output.getvalue()
             output.truncate(0)
@@ -209,34 +357,98 @@ class LiterateInterpreter(code.InteractiveConsole):
             return res[-1]
 
     def showtraceback(self):
-        try:
-            extype, value, tb = sys.exc_info()
-            sys.last_type = extype
-            sys.last_value = value
-            sys.last_traceback = tb
-            tblist = traceback.extract_tb(tb)
-            del tblist[:1]
-            lst = traceback.format_list(tblist)
-            if lst:
-                lst.insert(0, "Traceback (most recent call last):\n")
-            exc_msg = traceback.format_exception_only(extype, value)
-            lst[len(lst):] = exc_msg
-        finally:
-            tblist = tb = None
-
+        tb_text, self.exc_msg = util.format_traceback()
         if self.filename.startswith("<literate "):
-            self._fakeout.write(''.join(lst))
+            self._fakeout.write(tb_text)
+        elif sys.excepthook is sys.__excepthook__:
+            self.write(tb_text)
         else:
-            if sys.excepthook is sys.__excepthook__:
-                self.write(''.join(lst))
-            else:
-                sys.excepthook(extype, value, tb)
+            sys.excepthook(sys.last_type, sys.last_value,
+                           sys.last_traceback)
+
+    def _truncate_output(self, text, chunk_ind):
+        # show just the head and tail of large output, keeping the full
+        # version around so it can be paged through with "!more"
+        head, tail = text, ''
+
+        max_lines = self.max_output_lines
+        if max_lines is not None:
+            lines = text.splitlines(True)
+            if len(lines) > max_lines:
+                head_lines = (max_lines + 1) // 2
+                head = ''.join(lines[:head_lines])
+                tail = ''.join(lines[len(lines) - max_lines + head_lines:])
+
+        max_chars = self.max_output_chars
+        if max_chars is not None and len(head) + len(tail) > max_chars:
+            if not tail:
+                tail = head
+            tail_chars = min(len(tail), max_chars // 2)
+            head = head[:max_chars - tail_chars]
+            tail = tail[len(tail) - tail_chars:]
+
+        hidden_chars = len(text) - len(head) - len(tail)
+        if not hidden_chars:
+            return text
+
+        self._full_outputs[chunk_ind] = text
+        self._last_truncated = chunk_ind
+
+        hidden_lines = (text.count('\n') - head.count('\n') -
+                        tail.count('\n'))
+        if head and not head.endswith('\n'):
+            head += '\n'
+
+        if hidden_lines:
+            hidden = '{0} line(s), {1} characters'.format(hidden_lines,
+                                                          hidden_chars)
+        else:
+            hidden = '{0} characters'.format(hidden_chars)
+
+        notice = ('[... {hidden} hidden -- enter "!more {chunk}" at the '
+                  'prompt to see everything ...]\n').format(hidden=hidden,
+                                                            chunk=chunk_ind)
+
+        return head + notice + tail
+
+    def _page_output(self, args):
+        if args:
+            try:
+                chunk_ind = int(args[0])
+            except ValueError:
+                chunk_ind = None
+        else:
+            chunk_ind = self._last_truncated
+
+        if chunk_ind not in self._full_outputs:
+            self.write('There is no hidden output to show\n')
+            return
 
-        self.exc_msg = ''.join(exc_msg)
+        pydoc.pager(self._full_outputs[chunk_ind])
+
+    def _emit(self, event, **fields):
+        if self.events is not None:
+            self.events.emit(event, **fields)
+
+    def _chunk_filename(self, chunk_ind):
+        return "<literate {name}[{num}]>".format(name=self.name,
+                                                 num=chunk_ind)
 
     def _run_code(self, chunk, chunk_ind, pause=True):
-        self.filename = "<literate {name}[{num}]>".format(name=self.name,
-                                                          num=chunk_ind)
+        self.filename = self._chunk_filename(chunk_ind)
+        # NB: chunk.lineno is 0-based, but we report line numbers like
+        # --check problems do, 1-based
+        if chunk.lineno is None:
+            lineno = None
+            self._import_label = 'chunk {0}'.format(chunk_ind)
+        else:
+            lineno = chunk.lineno + 1
+            self._import_label = 'chunk {0} (line {1})'.format(chunk_ind,
+                                                               lineno)
+
+        self._emit('chunk_start', chunk=chunk_ind, lineno=lineno)
+        start_time = util.clock()
+
         more = False
         res = ""
         lines = chunk.source.split("\n")
@@ -251,8 +463,32 @@ class LiterateInterpreter(code.InteractiveConsole):
         else:
             mgr = noop_mgr(self)
 
+        # one of 'pass', 'fail', 'exception' (unexpected), or 'ok'
+        # (nothing was expected, and nothing went wrong)
+        status = 'ok'
         if chunk.want is not None or chunk.exc_msg is not None:
-            if len(res) > 0 or exc is not None:
+            if len(res) == 0 and exc is None:
+                if chunk.want or chunk.exc_msg is not None:
+                    status = 'fail'
+                    self.write('\n')
+                    with mgr as maker:
+                        if chunk.exc_msg is not None:
+                            maker.write('Warning, expected an exception, '
+                                        'but none was raised:\n')
+                            maker.write('================================'
+                                        '====================\n\n')
+                            maker.write('Expected:\n    ' + chunk.exc_msg)
+                        else:
+                            maker.write('Warning, output different from '
+                                        'expected:\n')
+                            maker.write('================================'
+                                        '========\n\n')
+                            maker.write(self._output_checker.output_difference(
+                                chunk, res, 0))
+                    self.write('\n')
+                else:
+                    status = 'pass'
+            else:
                 # compare to the expected output
                 # TODO(sross): convert options to optionsflags
                 optionsflags = 0
@@ -262,6 +498,7 @@ class LiterateInterpreter(code.InteractiveConsole):
                     same = self._output_checker.check_output(chunk.want,
                                                              res, 0)
                     if not same:
+                        status = 'fail'
                         self.write('\n')
                         with mgr as maker:
                             maker.write('Warning, output different from '
@@ -270,11 +507,14 @@ class LiterateInterpreter(code.InteractiveConsole):
                                         '========\n\n')
                             diff = checker.output_difference(chunk, res,
                                                              optionsflags)
-                            maker.write(diff)
+                            maker.write(self._truncate_output(diff,
+                                                              chunk_ind))
                         self.write('\n')
                     else:
-                        self.write(res)
+                        status = 'pass'
+                        self.write(self._truncate_output(res, chunk_ind))
                 elif chunk.exc_msg is None:
+                    status = 'exception'
                     self.write('\n')
                     with mgr as maker:
                         maker.write('Warning, unexpected exception:\n')
@@ -285,6 +525,7 @@ class LiterateInterpreter(code.InteractiveConsole):
                     same_ex = checker.check_output(chunk.exc_msg,
                                                    exc, optionsflags)
                     if not same_ex:
+                        status = 'fail'
                         self.write('\n')
                         with mgr as maker:
                             maker.write('Warning, exception different from '
@@ -293,12 +534,15 @@ class LiterateInterpreter(code.InteractiveConsole):
                                         '=========\n\n')
                             diff = checker.output_difference(chunk, res,
                                                              optionsflags)
-                            maker.write(diff)
+                            maker.write(self._truncate_output(diff,
+                                                              chunk_ind))
                         self.write('\n')
                     else:
-                        self.write(res)
+                        status = 'pass'
+                        self.write(self._truncate_output(res, chunk_ind))
         else:
             if exc is not None:
+                status = 'exception'
                 self.write('\n')
                 with mgr as maker:
                     maker.write('Warning, unexpected exception:\n')
@@ -306,17 +550,146 @@ class LiterateInterpreter(code.InteractiveConsole):
                     maker.write(exc)
                 self.write('\n')
             else:
-                self.write(res)
+                self.write(self._truncate_output(res, chunk_ind))
 
         if not self.pause:
             self.write(sys.ps1 + '\n')
 
+        self._emit('chunk_end', chunk=chunk_ind, lineno=lineno,
+                   status=status, duration=util.clock() - start_time,
+                   output_chars=len(res))
+        self.results.append((chunk_ind, lineno, status))
+        return status
+
+    def _check_chunk(self, chunk, chunk_ind):
+        if chunk.lineno is None:
+            base_lineno = None
+        else:
+            base_lineno = chunk.lineno + 1
+
+        if (chunk.exc_msg is None and chunk.want is not None and
+                chunk.want.startswith('Traceback (most recent call')):
+            return (base_lineno, 'traceback in expected output is missing '
+                                 'the exception line')
+
+        try:
+            compile(chunk.source, self._chunk_filename(chunk_ind), 'exec',
+                    self.compile_flags, True)
+        except (SyntaxError, OverflowError, ValueError):
+            extype, value = sys.exc_info()[:2]
+            msg = traceback.format_exception_only(extype, value)[-1].strip()
+            err_lineno = getattr(value, 'lineno', None)
+            if base_lineno is not None and err_lineno is not None:
+                return (base_lineno + err_lineno - 1, msg)
+            else:
+                return (base_lineno, msg)
+
+    def load(self, lit_string, name):
+        self.name = name
+        self.chunks = chunks.ChunkStore(self.code_parser.parse(lit_string,
+                                                               name))
+        self._renderer.reset(self.chunks, self.text_formatter)
+
+    def check(self, lit_string, name):
+        # compile every chunk without running anything, returning a list
+        # of (lineno, message) pairs (lineno is 1-based, or None if unknown)
+        try:
+            self.load(lit_string, name)
+        except ValueError as ex:
+            # the doctest parser bails out on malformed examples
+            self.chunks = None
+            return [(None, six.text_type(ex))]
+
+        return self._check_chunks()
+
+    def _check_chunks(self):
+        problems = []
+        for chunk_ind in six.moves.range(len(self.chunks)):
+            if not self.chunks.is_code(chunk_ind):
+                continue
+
+            problem = self._check_chunk(self.chunks[chunk_ind], chunk_ind)
+            if problem is not None:
+                problems.append(problem)
+
+        return problems
+
+    def format_problem(self, problem):
+        lineno, msg = problem
+        if lineno is None:
+            return "{name}: {msg}".format(name=self.name, msg=msg)
+        else:
+            return "{name}:{lineno}: {msg}".format(name=self.name,
+                                                   lineno=lineno, msg=msg)
+
     def no_echo_input(self, prompt):
+        if not sys.stdin.isatty():
+            # getpass would try to use the controlling terminal instead
+            self.write(prompt)
+            return sys.stdin.readline().rstrip('\n')
+
         with warnings.catch_warnings():
             res = getpass.getpass(prompt)
         return res
 
-    def interact(self, lit_string, name, pause=True, interactive=True):
+    def start_env(self):
+        # returns whether or not this call actually set up the env driver
+        if self._env_driver is None or self._env_started:
+            return False
+
+        extra_locals = self._env_driver.setup()
+        self._update_locals(extra_locals)
+        self._env_started = True
+        return True
+
+    def stop_env(self):
+        if self._env_started:
+            self._env_started = False
+            self._env_driver.teardown()
+
+    def replay(self, start, end, chunk_filter=None):
+        # silently run the code chunks in [start, end) (optionally just the
+        # ones whose indices chunk_filter accepts) to rebuild the state that
+        # later chunks depend on, returning the numbers of chunks run and of
+        # chunks which raised exceptions they weren't expected to raise
+        replayed = failed = 0
+        for chunk_ind in six.moves.range(start, end):
+            if not self.chunks.is_code(chunk_ind):
+                continue
+
+            if chunk_filter is not None and not chunk_filter(chunk_ind):
+                continue
+
+            chunk = self.chunks[chunk_ind]
+            self.filename = self._chunk_filename(chunk_ind)
+            raised = False
+            lines = chunk.source.split("\n")
+            with self._capture_output() as output:
+                more = False
+                for line in lines[:-1]:
+                    more = self.push(line)
+                    raised = raised or self.exc_msg is not None
+                    self.exc_msg = None
+
+                if more:
+                    self.push(lines[-1])
+                    raised = raised or self.exc_msg is not None
+                    self.exc_msg = None
+
+                output.truncate(0)
+
+            replayed += 1
+            if raised and chunk.exc_msg is None:
+                failed += 1
+
+        return (replayed, failed)
+
+    def interact(self, lit_string, name, pause=True, interactive=True,
+                 start_at=None, precheck=True, stop_at=None, console=True):
+        # if lit_string is None, the document passed to load()
+        # is used instead of parsing a new one.  Chunks from start_at
+        # up to (but not including) stop_at are run, and then, if console
+        # is True, we drop into the interactive console.
         self.name = name
         self.pause = pause
         self.interactive = interactive
@@ -336,9 +709,8 @@ class LiterateInterpreter(code.InteractiveConsole):
         except AttributeError:
             sys.ps3 = '>>> '
 
+        own_env = self.start_env()
         if self._env_driver is not None:
-            extra_locals = self._env_driver.setup()
-            self.locals.update(extra_locals)
             extra_banner = self._env_driver.banner
             driver_text = " ({0})".format(self._env_driver.DRIVER_NAME)
         else:
@@ -359,15 +731,55 @@ class LiterateInterpreter(code.InteractiveConsole):
             self.write('Press enter to continue after a code block\n\n')
 
         try:
-            parser = self.code_parser
             start = True
-            self.chunks = list(parser.parse(lit_string, name))
-            for chunk_ind, chunk in enumerate(self.chunks):
+            if lit_string is not None:
+                self.load(lit_string, name)
+
+            self.results = []
+            self._emit('document_start', name=name, chunks=len(self.chunks))
+            doc_start_time = util.clock()
+            statuses = {}
+
+            problems = self._check_chunks() if precheck else []
+            if problems:
+                if self.use_ansi:
+                    mgr = ansi.BoxMaker(self)
+                else:
+                    mgr = noop_mgr(self)
+
+                with mgr as maker:
+                    maker.write('Warning, found problems before running:\n')
+                    maker.write('=======================================\n\n')
+                    for problem in problems:
+                        maker.write(self.format_problem(problem) + '\n')
+                self.write('\n')
+
+            # start_at may be a chunk number or a section heading
+            if start_at is not None:
+                start_ind = self.chunks.find(start_at)
+            else:
+                start_ind = 0
+
+            if stop_at is not None:
+                stop_ind = min(stop_at, len(self.chunks))
+            else:
+                stop_ind = len(self.chunks)
+
+            for chunk_ind in six.moves.range(start_ind, stop_ind):
+                self._renderer.advance(chunk_ind)
+                chunk = self.chunks[chunk_ind]
                 if isinstance(chunk, parsers.CodeChunk):
-                    self._run_code(chunk, chunk_ind)
+                    status = self._run_code(chunk, chunk_ind)
+                    statuses[status] = statuses.get(status, 0) + 1
                 elif not chunk:
                     continue
                 else:
+                    if not start and pause:
+                        # we're about to sit around waiting for the user
+                        if self.events is not None:
+                            self.events.flush()
+                        pause_start_time = util.clock()
+
                     if not start and pause and interactive:
                         self.filename = "<stdin>"
                         more = False
@@ -389,10 +801,27 @@ class LiterateInterpreter(code.InteractiveConsole):
                     elif not start and pause:
                         self.no_echo_input(sys.ps3)
 
-                    self.write(self.text_formatter.format(chunk))
+                    if not start and pause:
+                        self._emit('pause', chunk=chunk_ind,
+                                   duration=util.clock() - pause_start_time)
+
+                    self.write(self._renderer.render(chunk_ind))
 
                 start = False
 
+            self._emit('document_end', name=name,
+                       duration=util.clock() - doc_start_time,
+                       problems=len(problems), statuses=statuses)
+            if self.events is not None:
+                self.events.flush()
+
+            if self.import_profiler is not None:
+                self.write('\n')
+                self.write(self.import_profiler.report())
+
+            if not console:
+                return
+
             complete_msg = ("\n{file} complete! Continuing to interactive "
                             "console...\n\n".format(file=self.name))
 
@@ -401,11 +830,27 @@ class LiterateInterpreter(code.InteractiveConsole):
             else:
                 self.write(complete_msg)
 
+            self._renderer.stop()
             self.filename = "<stdin>"
-            self.locals['con'] = self
+            if self._kernel is None:
+                self.locals['con'] = self
             more = False
             while more is not None:
                 blank, more = self._interact_once(more)
         finally:
-            if self._env_driver is not None:
-                self._env_driver.teardown()
+            self._renderer.stop()
+
+            if self.events is not None:
+                self.events.flush()
+
+            if self._event_loop is not None:
+                self._event_loop.stop()
+
+            if self._kernel is not None:
+                self._kernel.shutdown()
+
+            if self.capture_fds:
+                self._fakeout.close()
+
+            if own_env:
+                self.stop_env()
@@ -0,0 +1,76 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import json
+import os
+import socket
+import time
+
+from yalpt import util
+
+
+__all__ = ["EventStream"]
+
+
+class EventStream(object):
+    # Writes events as JSON lines to a file, an already-open fd or a Unix
+    # socket.  Targets are given as a path, 'fd:N', or 'unix:PATH'.
+    #
+    # Events are batched up and sent with a single write once `batch_size`
+    # events are pending or `flush_interval` seconds have passed, so
+    # each batch shows up as a contiguous set of whole lines even when
+    # several processes share a file (which is opened for appending).
+
+    def __init__(self, target, batch_size=64, flush_interval=1.0):
+        self.target = target
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._batch = []
+        self._last_flush = util.clock()
+        self._sock = None
+        self._fd = None
+        self._close_fd = False
+
+        if target.startswith('fd:'):
+            self._fd = int(target[3:])
+        elif target.startswith('unix:'):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(target[5:])
+        else:
+            self._fd = os.open(target,
+                               os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._close_fd = True
+
+    def emit(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = time.time()
+        fields['pid'] = os.getpid()
+        self._batch.append(json.dumps(fields, sort_keys=True))
+
+        if (len(self._batch) >= self.batch_size or
+                util.clock() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = util.clock()
+        if not self._batch:
+            return
+
+        data = ('\n'.join(self._batch) + '\n').encode('utf-8')
+        self._batch = []
+
+        if self._sock is not None:
+            self._sock.sendall(data)
+        else:
+            while data:
+                written = os.write(self._fd, data)
+                data = data[written:]
+
+    def close(self):
+        self.flush()
+
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        elif self._close_fd:
+            os.close(self._fd)
+            self._fd = None
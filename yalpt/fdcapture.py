@@ -0,0 +1,229 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+# NB: this module is POSIX-only, so it's only imported when
+# file-descriptor-level capture is requested
+import codecs
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import os
+import select
+import sys
+import threading
+
+
+__all__ = ["FDCapture"]
+
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'))
+except (OSError, TypeError):
+    _libc = None
+
+
+def _flush_c_stdio():
+    # C code writing with stdio buffers its output when it's not writing
+    # to a terminal, so we have to flush it to keep things in order
+    if _libc is not None:
+        _libc.fflush(None)
+
+
+class FDCapture(object):
+    # A drop-in replacement for doctest's _SpoofOut which, while redirect()
+    # is active, also captures anything written straight to the stdout and
+    # stderr file descriptors (by C extensions, subprocesses, etc).
+    #
+    # The file descriptors are pointed at a pipe, which a background thread
+    # drains into a buffer of at most max_size characters (anything past
+    # that is counted and dropped), so writers never block on a full pipe.
+    # Python-level writes drain the pipe before being buffered themselves,
+    # so both kinds of output stay in the order they were written.
+    #
+    # Anything written to the pipe outside of redirect() (say, by a
+    # subprocess started by an earlier chunk, which inherited the fds) is
+    # passed through to the terminal instead of ending up in the output of
+    # whichever chunk runs next.  Such processes may keep the pipe open
+    # indefinitely, so the reader thread is stopped through a separate
+    # wakeup pipe rather than by waiting for EOF.
+
+    def __init__(self, fds=(1, 2), max_size=16 * 1024 * 1024,
+                 encoding=None):
+        self.fds = fds
+        self.max_size = max_size
+        self.encoding = encoding or getattr(sys.stdout, 'encoding',
+                                            None) or 'utf-8'
+
+        self._lock = threading.Lock()
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(
+            'replace')
+        self._buff = []
+        self._size = 0
+        self._dropped = 0
+
+        self._read_fd = None
+        self._write_fd = None
+        self._wake_fds = None
+        self._thread = None
+        self._stopping = False
+        self._redirected = False
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        self._read_fd, self._write_fd = os.pipe()
+        self._wake_fds = os.pipe()
+        flags = fcntl.fcntl(self._read_fd, fcntl.F_GETFL)
+        fcntl.fcntl(self._read_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='yalpt-fd-capture')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            select.select([self._read_fd, self._wake_fds[0]], [], [])
+            with self._lock:
+                if self._stopping or not self._drain():
+                    return
+
+    def _drain(self):
+        # must be called with the lock held -- returns False on EOF
+        while True:
+            try:
+                data = os.read(self._read_fd, 65536)
+            except OSError as ex:
+                if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return True
+                elif ex.errno == errno.EINTR:
+                    continue
+                raise
+
+            if not data:
+                return False
+
+            if self._redirected:
+                self._append(self._decoder.decode(data))
+            else:
+                self._pass_through(data)
+
+    def _pass_through(self, data):
+        # outside of redirect(), self.fds[0] is the real stdout again
+        try:
+            while data:
+                data = data[os.write(self.fds[0], data):]
+        except OSError:
+            pass
+
+    def _append(self, data):
+        room = self.max_size - self._size
+        if len(data) > room:
+            self._dropped += len(data) - max(room, 0)
+            data = data[:max(room, 0)]
+
+        if data:
+            self._buff.append(data)
+            self._size += len(data)
+
+    def _sync(self):
+        # pull in anything written to the file descriptors so far
+        if self._thread is not None:
+            _flush_c_stdio()
+            self._drain()
+
+    def write(self, data):
+        with self._lock:
+            self._sync()
+            self._append(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        # only meaningful inside redirect(), but then writing to
+        # this fd ends up in the capture like everything else
+        return self.fds[0]
+
+    def getvalue(self):
+        with self._lock:
+            self._sync()
+            res = ''.join(self._buff)
+            if self._dropped:
+                res += ('\n[... {0} more characters of output '
+                        'dropped ...]\n'.format(self._dropped))
+
+        # see doctest._SpoofOut.getvalue
+        if res and not res.endswith('\n'):
+            res += '\n'
+
+        return res
+
+    def truncate(self, size=None):
+        # like _SpoofOut, this is only ever used to clear the buffer
+        with self._lock:
+            self._sync()
+            self._buff = []
+            self._size = 0
+            self._dropped = 0
+
+    @contextlib.contextmanager
+    def redirect(self):
+        self._start()
+
+        # anything already buffered belongs to the terminal
+        sys.__stdout__.flush()
+        sys.__stderr__.flush()
+        _flush_c_stdio()
+
+        saved_fds = [os.dup(fd) for fd in self.fds]
+        with self._lock:
+            # anything still in the pipe was written before we started
+            self._drain()
+            self._redirected = True
+
+        for fd in self.fds:
+            os.dup2(self._write_fd, fd)
+
+        try:
+            yield self
+        finally:
+            sys.__stdout__.flush()
+            sys.__stderr__.flush()
+            _flush_c_stdio()
+
+            for fd, saved_fd in zip(self.fds, saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+
+            with self._lock:
+                self._drain()
+                self._redirected = False
+
+    def close(self):
+        if self._thread is None:
+            return
+
+        # NB: don't wait for EOF -- subprocesses may still hold the
+        # write end of the pipe
+        self._stopping = True
+        os.write(self._wake_fds[1], b'x')
+        self._thread.join()
+
+        with self._lock:
+            self._drain()
+
+        for fd in (self._read_fd, self._write_fd) + tuple(self._wake_fds):
+            os.close(fd)
+
+        self._thread = None
+        self._read_fd = self._write_fd = self._wake_fds = None
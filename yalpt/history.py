@@ -0,0 +1,80 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import contextlib
+import io
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # no locking on this platform
+    fcntl = None
+
+
+__all__ = ["History"]
+
+
+class History(object):
+    # Readline history which is stored in a file that's appended to as
+    # entries are added (rather than rewritten on exit), with an exclusive
+    # lock held for each change, so several sessions can share it safely.
+    #
+    # Both the in-memory history and the file are capped at roughly
+    # max_entries entries -- the file is compacted on load once it has
+    # grown to twice that.
+
+    def __init__(self, readline, path, max_entries=1000):
+        self.readline = readline
+        self.path = path
+        self.max_entries = max_entries
+
+    @contextlib.contextmanager
+    def _locked_file(self, mode):
+        if mode == 'a':
+            flags = os.O_CREAT | os.O_WRONLY | os.O_APPEND
+        else:
+            flags = os.O_CREAT | os.O_RDWR
+            mode = 'r+'
+
+        fd = os.open(self.path, flags, 0o600)
+        with io.open(fd, mode, encoding='utf-8', errors='replace') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+            # NB: closing the file releases the lock
+            yield f
+
+    def load(self):
+        try:
+            with self._locked_file('r') as f:
+                entries = f.read().splitlines()
+
+                # libedit writes a header line
+                if entries and entries[0] == '_HiStOrY_V2_':
+                    del entries[0]
+
+                if len(entries) > self.max_entries * 2:
+                    entries = entries[-self.max_entries:]
+                    f.seek(0)
+                    f.truncate()
+                    f.write(u''.join(entry + u'\n' for entry in entries))
+        except (IOError, OSError):
+            return
+
+        for entry in entries[-self.max_entries:]:
+            self.readline.add_history(entry)
+
+    def add(self, entry, to_readline=True):
+        if not entry.strip():
+            return
+
+        if to_readline:
+            self.readline.add_history(entry)
+
+        while self.readline.get_current_history_length() > self.max_entries:
+            self.readline.remove_history_item(0)
+
+        try:
+            with self._locked_file('a') as f:
+                f.write(entry + u'\n')
+        except (IOError, OSError):
+            pass
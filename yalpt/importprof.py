@@ -0,0 +1,181 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import contextlib
+import sys
+import threading
+
+from six.moves import builtins
+
+from yalpt import util
+
+
+__all__ = ["ImportProfiler"]
+
+
+# module specs (and sys.meta_path finders which return them) are new
+# in Python 3.4 -- before that, we can only wrap __import__
+_USE_SPECS = sys.version_info >= (3, 4)
+
+
+class _TimedLoader(object):
+    # Stands in for a module's real loader just long enough to time
+    # exec_module, which is where the module's code actually runs.
+
+    def __init__(self, profiler, loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def exec_module(self, module):
+        # don't leave ourselves behind on the module
+        module.__loader__ = self._loader
+        if getattr(module, '__spec__', None) is not None:
+            module.__spec__.loader = self._loader
+
+        return self._profiler._timed(module.__name__,
+                                     self._loader.exec_module, module)
+
+
+class _TimingFinder(object):
+    # A sys.meta_path entry which asks the rest of sys.meta_path to find
+    # the module, and then swaps in a _TimedLoader for its loader.  Unlike
+    # wrapping __import__, this also sees submodules loaded by
+    # "from pkg import submodule" and importlib.import_module.
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = None
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+
+            find_spec = getattr(finder, 'find_spec', None)
+            if find_spec is None:
+                # a legacy finder -- let the import system deal with it
+                return None
+
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                break
+
+        if spec is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(self._profiler, spec.loader)
+
+        return spec
+
+
+class ImportProfiler(object):
+    # Times every module loaded while profiling is active, by way of a
+    # sys.meta_path hook.  Each module gets a self time (time not spent
+    # loading nested modules) and a cumulative time, and is attributed to
+    # the label passed to profile() (normally the chunk being run).
+
+    def __init__(self):
+        # (label, module name, depth, self time, cumulative time)
+        self.records = []
+        self._label = None
+        self._orig_import = None
+        self._finder = _TimingFinder(self)
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def profile(self, label):
+        self._label = label
+        if _USE_SPECS:
+            sys.meta_path.insert(0, self._finder)
+        else:
+            self._orig_import = builtins.__import__
+            builtins.__import__ = self._import
+
+        try:
+            yield
+        finally:
+            if _USE_SPECS:
+                if self._finder in sys.meta_path:
+                    sys.meta_path.remove(self._finder)
+            else:
+                builtins.__import__ = self._orig_import
+            self._label = None
+
+    def _timed(self, name, func, *args, **kwargs):
+        # time spent in nested imports, for each import in progress
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        label = self._label
+        stack.append(0.0)
+        start = util.clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cumulative = util.clock() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+
+            self.records.append((label, name, len(stack),
+                                 cumulative - nested, cumulative))
+
+    @staticmethod
+    def _resolve(name, globs, level):
+        if level is None or level <= 0:
+            # NB: this treats Python 2 implicit relative imports as absolute
+            return name
+
+        package = globs.get('__package__') if globs else None
+        if not package:
+            return None
+
+        bits = package.rsplit('.', level - 1)
+        if len(bits) < level:
+            return None
+
+        if name:
+            return '%s.%s' % (bits[0], name)
+        else:
+            return bits[0]
+
+    def _import(self, name, *args, **kwargs):
+        # the Python 2 version of the hook
+        globs = args[0] if args else kwargs.get('globals')
+        level = args[3] if len(args) > 3 else kwargs.get('level', 0)
+        full_name = self._resolve(name, globs, level)
+
+        if full_name is None or full_name in sys.modules:
+            return self._orig_import(name, *args, **kwargs)
+
+        return self._timed(full_name, self._orig_import, name,
+                           *args, **kwargs)
+
+    def report(self, limit=10):
+        totals = {}
+        top_level = {}
+        for label, name, depth, self_time, cumulative in self.records:
+            if depth == 0:
+                totals[label] = totals.get(label, 0.0) + cumulative
+                top_level.setdefault(label, []).append((cumulative,
+                                                        self_time, name))
+
+        if not totals:
+            return 'No modules were imported.\n'
+
+        lines = ['Import time by chunk:', '']
+        ranked = sorted(totals.items(), key=lambda item: -item[1])
+        for label, total in ranked:
+            lines.append('  {0}: {1:.3f}s'.format(label, total))
+            for cumulative, self_time, name in sorted(top_level[label],
+                                                      reverse=True)[:limit]:
+                lines.append('    {0:<32} self {1:.3f}s  cumulative '
+                             '{2:.3f}s'.format(name, self_time, cumulative))
+
+        lines.extend(['', 'Slowest imports (self time):', ''])
+        by_self = sorted(self.records, key=lambda record: -record[3])
+        for label, name, depth, self_time, cumulative in by_self[:limit]:
+            lines.append('  {0:<34} {1:.3f}s  ({2})'.format(
+                name, self_time, label))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,309 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import code
+import linecache
+import multiprocessing
+import os
+import signal
+import sys
+
+from six.moves import cPickle as pickle
+
+from yalpt import util
+
+
+__all__ = ["Kernel", "KernelDiedError"]
+
+
+# Protocol (all messages are tuples sent over a multiprocessing pipe)
+#
+# front end -> kernel:
+#   ('push', filename, line) -- push a line of source, like
+#                               InteractiveConsole.push
+#   ('update', locals_dict)  -- add names to the kernel namespace
+#   ('reset',)               -- discard any partially entered source
+#   ('shutdown',)            -- exit cleanly
+#
+# kernel -> front end:
+#   ('stdout', text)              -- streamed output of the running code
+#   ('stderr', text)              -- streamed error output
+#   ('result', more, exc_msg)     -- the reply to 'push' or 'update'
+#   ('exit', code)                -- the reply to 'push' when the code
+#                                    raised SystemExit
+
+
+class KernelDiedError(Exception):
+    def __init__(self, exitcode):
+        super(KernelDiedError, self).__init__(exitcode)
+        self.exitcode = exitcode
+
+    def __str__(self):
+        if self.exitcode is None:
+            return 'the kernel stopped responding'
+        elif self.exitcode < 0:
+            return 'the kernel was killed by signal %s' % -self.exitcode
+        else:
+            return 'the kernel exited with status %s' % self.exitcode
+
+
+class _PipeWriter(object):
+    def __init__(self, conn, stream):
+        self._conn = conn
+        self._stream = stream
+        self.softspace = 0
+
+    def write(self, data):
+        if data:
+            self._conn.send((self._stream, data))
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class _KernelInterpreter(code.InteractiveInterpreter):
+    # this is the part that lives in the child process
+
+    def __init__(self, conn):
+        code.InteractiveInterpreter.__init__(self)
+        self.conn = conn
+        self.buffer = []
+        self.filename = '<stdin>'
+        self.exc_msg = None
+        self._sources = {}
+
+        sys.stdout = _PipeWriter(conn, 'stdout')
+        sys.stderr = _PipeWriter(conn, 'stderr')
+
+        self._save_linecache_getlines = linecache.getlines
+        linecache.getlines = self._patched_linecache_getlines
+
+    def _patched_linecache_getlines(self, filename, module_globals=None):
+        if filename in self._sources:
+            return self._sources[filename]
+        else:
+            return self._save_linecache_getlines(filename, module_globals)
+
+    def write(self, data):
+        sys.stderr.write(data)
+
+    def showtraceback(self):
+        # chunk tracebacks are part of the chunk's output, like they are
+        # in the front end
+        tb_text, self.exc_msg = util.format_traceback()
+        if self.filename.startswith("<literate "):
+            sys.stdout.write(tb_text)
+        else:
+            self.write(tb_text)
+
+    def push(self, filename, line):
+        self.filename = filename
+        if filename.startswith('<literate '):
+            self._sources.setdefault(filename, []).append(line + '\n')
+
+        self.buffer.append(line)
+        more = self.runsource('\n'.join(self.buffer), filename)
+        if not more:
+            self.buffer = []
+
+        return more
+
+    def serve(self):
+        while True:
+            # only let ^C interrupt running code -- the front end
+            # shares our terminal, so we'll see its interrupts as well
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                msg = self.conn.recv()
+            except EOFError:
+                return
+
+            cmd = msg[0]
+            if cmd == 'push':
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                try:
+                    more = self.push(msg[1], msg[2])
+                except SystemExit as ex:
+                    # let the front end exit, like it would in-process
+                    code = ex.code
+                    if not isinstance(code, (int, type(None))):
+                        code = str(code)
+                    self.conn.send(('exit', code))
+                    continue
+                except KeyboardInterrupt:
+                    # raised outside of the user's code
+                    self.buffer = []
+                    more = False
+                    self.write('\nKeyboardInterrupt\n')
+
+                exc_msg = self.exc_msg
+                self.exc_msg = None
+                self.conn.send(('result', more, exc_msg))
+            elif cmd == 'update':
+                self.locals.update(msg[1])
+                self.conn.send(('result', False, None))
+            elif cmd == 'reset':
+                self.buffer = []
+            elif cmd == 'shutdown':
+                return
+
+
+def _fork_context():
+    # The kernel has to be forked: with the spawn and forkserver start
+    # methods, the child re-imports the __main__ module (i.e. run-lit.py),
+    # which would run the whole document over again.
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None:
+        # Python 2 always forks on POSIX
+        return multiprocessing if hasattr(os, 'fork') else None
+
+    try:
+        return get_context('fork')
+    except ValueError:
+        return None
+
+
+def _kernel_main(conn):
+    if '' not in sys.path:
+        sys.path.insert(0, '')
+
+    _KernelInterpreter(conn).serve()
+
+
+class Kernel(object):
+    # The front end's handle on a kernel process.  The process is started
+    # lazily, and may be restarted after it dies (which loses its namespace,
+    # except for names passed to update()).
+
+    def __init__(self):
+        self._mp = _fork_context()
+        if self._mp is None:
+            raise ValueError('running code in a kernel process requires '
+                             'a platform which supports fork')
+
+        self._process = None
+        self._conn = None
+        self._locals = {}
+
+    @property
+    def running(self):
+        return self._process is not None
+
+    def start(self):
+        if self._process is not None:
+            return
+
+        parent_conn, child_conn = self._mp.Pipe()
+        self._process = self._mp.Process(target=_kernel_main,
+                                         args=(child_conn,),
+                                         name='yalpt-kernel')
+        self._process.daemon = True
+        self._process.start()
+
+        # close our copy of the child's end, so that we see EOF if it dies
+        child_conn.close()
+        self._conn = parent_conn
+
+        if self._locals:
+            self._call(('update', self._locals))
+
+    def _died(self):
+        self._process.join(1)
+        exitcode = self._process.exitcode
+        if exitcode is None:
+            self._process.terminate()
+            self._process.join(1)
+
+        self._conn.close()
+        self._conn = None
+        self._process = None
+        return KernelDiedError(exitcode)
+
+    def _call(self, msg, on_output=None, idle=None):
+        try:
+            self._conn.send(msg)
+        except (EOFError, IOError, OSError):
+            raise self._died()
+
+        while True:
+            # NB: the kernel shares our terminal, so it gets any interrupt
+            # too, and will still send its reply -- we have to keep waiting
+            # for that wherever the interrupt lands, or we'd read it as the
+            # reply to the next call
+            try:
+                # do some other work while the kernel is busy
+                while idle is not None and not self._conn.poll():
+                    if not idle():
+                        idle = None
+
+                reply = self._conn.recv()
+            except KeyboardInterrupt:
+                continue
+            except (EOFError, IOError, OSError):
+                raise self._died()
+
+            if reply[0] == 'result':
+                return reply[1:]
+            elif reply[0] == 'exit':
+                raise SystemExit(reply[1])
+            elif on_output is not None:
+                try:
+                    on_output(*reply)
+                except KeyboardInterrupt:
+                    continue
+
+    def push(self, filename, line, on_output, idle=None):
+        self.start()
+        return self._call(('push', filename, line), on_output, idle)
+
+    def update(self, new_locals):
+        # returns the names which couldn't be sent to the kernel
+        skipped = []
+        for name, val in new_locals.items():
+            try:
+                pickle.dumps(val, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                skipped.append(name)
+            else:
+                self._locals[name] = val
+
+        if self._process is not None:
+            self._call(('update', dict((name, self._locals[name])
+                                       for name in new_locals
+                                       if name not in skipped)))
+
+        return skipped
+
+    def reset(self):
+        if self._process is not None:
+            try:
+                self._conn.send(('reset',))
+            except (EOFError, IOError, OSError):
+                self._died()
+
+    def shutdown(self, timeout=5):
+        if self._process is None:
+            return
+
+        try:
+            self._conn.send(('shutdown',))
+        except (EOFError, IOError, OSError):
+            pass
+
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout)
+
+        self._conn.close()
+        self._conn = None
+        self._process = None
+
+    def restart(self):
+        self.shutdown()
+        self.start()
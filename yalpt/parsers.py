@@ -2,6 +2,9 @@ import doctest
 
 
 class CodeChunk(object):
+    __slots__ = ('source', 'want', 'exc_msg', 'lineno', 'indent',
+                 'source_obj', 'options')
+
     def __init__(self, source_obj, source, want=None, exc_msg=None,
                  lineno=None, indent=0):
         self.source = source
@@ -25,8 +28,9 @@ class DocTestParser(object):
 
         for chunk in parser.parse(literate_string, file_name):
             if isinstance(chunk, doctest.Example):
-                yield CodeChunk(chunk, chunk.source, chunk.want, chunk.exc_msg,
-                                chunk.lineno, chunk.indent)
+                # don't hold on to the doctest Example itself
+                yield CodeChunk(chunk.source, chunk.source, chunk.want,
+                                chunk.exc_msg, chunk.lineno, chunk.indent)
             else:
                 yield chunk
 
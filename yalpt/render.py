@@ -0,0 +1,150 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import threading
+
+import six
+
+
+__all__ = ["LookaheadRenderer"]
+
+
+class LookaheadRenderer(object):
+    # Formats text chunks ahead of time, so that they're ready by the time
+    # the reader gets to them.  Up to `lookahead` upcoming text chunks are
+    # formatted on a background thread (if lookahead is 0, only
+    # prerender_one() does any work ahead of time).
+    #
+    # Formatters aren't required to be thread-safe, so all formatting
+    # happens with _format_lock held.
+
+    def __init__(self, lookahead=2):
+        self.lookahead = lookahead
+        self._format_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._waiting = 0
+        self._reset_state(None, None)
+
+    def _reset_state(self, chunks, formatter):
+        self._chunks = chunks
+        self._formatter = formatter
+        self._pos = None
+        self._rendered = {}
+
+    def reset(self, chunks, formatter):
+        with self._cond:
+            with self._format_lock:
+                self._reset_state(chunks, formatter)
+
+    def _upcoming(self):
+        # the text chunks that should be rendered ahead of time
+        if self._pos is None:
+            return []
+
+        res = []
+        for chunk_ind in six.moves.range(self._pos, len(self._chunks)):
+            if len(res) >= max(self.lookahead, 1):
+                break
+
+            chunks = self._chunks
+            if not chunks.is_code(chunk_ind) and chunks[chunk_ind]:
+                res.append(chunk_ind)
+
+        return res
+
+    def _next_pending(self):
+        for chunk_ind in self._upcoming():
+            if chunk_ind not in self._rendered:
+                return chunk_ind
+
+    def advance(self, chunk_ind):
+        # we're about to get to the given chunk, so start working on the
+        # text chunks from here onwards
+        with self._cond:
+            self._pos = chunk_ind
+
+            # drop anything we've gone past
+            for old_ind in list(self._rendered):
+                if old_ind < chunk_ind:
+                    del self._rendered[old_ind]
+
+            if self.lookahead > 0 and self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run,
+                                                name='yalpt-renderer')
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._cond.notify()
+
+    def prerender_one(self, blocking=False):
+        # render the next pending chunk, returning whether or not
+        # there was anything to do
+        if not self._format_lock.acquire(blocking):
+            return False
+
+        try:
+            chunk_ind = self._next_pending()
+            if chunk_ind is None:
+                return False
+
+            self._rendered[chunk_ind] = self._formatter.format(
+                self._chunks[chunk_ind])
+            return True
+        finally:
+            self._format_lock.release()
+
+    def prerender_all(self):
+        with self._format_lock:
+            for chunk_ind in six.moves.range(len(self._chunks)):
+                chunk = self._chunks[chunk_ind]
+                if (not self._chunks.is_code(chunk_ind) and chunk and
+                        chunk_ind not in self._rendered):
+                    self._rendered[chunk_ind] = self._formatter.format(chunk)
+
+    def render(self, chunk_ind):
+        # if the background thread is working on this chunk, this
+        # waits for it to finish instead of formatting it twice
+        # (and keeps it from starting on anything else in the meantime)
+        with self._cond:
+            self._waiting += 1
+
+        try:
+            with self._format_lock:
+                res = self._rendered.pop(chunk_ind, None)
+                if res is None:
+                    res = self._formatter.format(self._chunks[chunk_ind])
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+                # don't bother rendering this one again
+                if self._pos is not None and self._pos <= chunk_ind:
+                    self._pos = chunk_ind + 1
+
+                self._cond.notify()
+
+        return res
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (self._waiting or
+                                             self._next_pending() is None):
+                    self._cond.wait()
+
+                if self._stopped:
+                    return
+
+            self.prerender_one(blocking=True)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.reset(None, None)
@@ -0,0 +1,215 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+# NB: this module is POSIX-only (it relies on fork)
+import errno
+import os
+import signal
+import socket
+import sys
+import traceback
+
+
+__all__ = ["TutorialServer", "parse_address", "is_loopback"]
+
+
+def parse_address(address):
+    # 'HOST:PORT' means TCP, anything else is a Unix socket path
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return (host or 'localhost', int(port))
+    else:
+        return address
+
+
+def is_loopback(host):
+    # whether every address host resolves to is a loopback address
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+
+    for info in infos:
+        addr = info[4][0]
+        if not (addr.startswith('127.') or addr == '::1'):
+            return False
+
+    return bool(infos)
+
+
+class TutorialServer(object):
+    # Serves a literate program to many concurrent sessions over a local
+    # socket.  The document is parsed, checked and formatted once, and the
+    # env driver is set up once, in the server process.  Each connection
+    # then gets a forked copy of that warm interpreter, so every session
+    # has its own namespace without repeating any of the setup.
+    #
+    # NB: sessions are unauthenticated Python shells, so TCP addresses must
+    # be loopback ones unless allow_remote is set.
+
+    def __init__(self, interpreter, lit_string, name, address,
+                 max_sessions=10, pause=True, interactive=True,
+                 start_at=None, log=None, allow_remote=False):
+        if (isinstance(address, tuple) and not allow_remote and
+                not is_loopback(address[0])):
+            raise ValueError('{0} is not a loopback address -- anyone who '
+                             'can connect to it would get a Python shell '
+                             'on this machine'.format(address[0]))
+
+        self.interpreter = interpreter
+        self.lit_string = lit_string
+        self.name = name
+        self.address = address
+        self.max_sessions = max_sessions
+        self.pause = pause
+        self.interactive = interactive
+        self.start_at = start_at
+        self.log = log or sys.stderr
+
+        self.sessions = set()
+        self._sock = None
+
+    def _listen(self):
+        if isinstance(self.address, tuple):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                os.unlink(self.address)
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+
+        sock.bind(self.address)
+        sock.listen(min(self.max_sessions, socket.SOMAXCONN))
+
+        # wake up every so often to reap finished sessions
+        sock.settimeout(1.0)
+        self._sock = sock
+
+    def _reap(self):
+        while self.sessions:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as ex:
+                if ex.errno == errno.ECHILD:
+                    self.sessions.clear()
+                    return
+                raise
+
+            if pid == 0:
+                return
+
+            self.sessions.discard(pid)
+            self.log.write('session {0} finished ({1} active)\n'.format(
+                pid, len(self.sessions)))
+
+    def _prepare(self):
+        interp = self.interpreter
+        interp.load(self.lit_string, self.name)
+
+        for problem in interp._check_chunks():
+            self.log.write(interp.format_problem(problem) + '\n')
+
+        # format everything up front, so sessions don't have to
+        interp._renderer.prerender_all()
+
+    def _run_session(self, conn):
+        # runs in the forked child -- never returns
+        status = 0
+        try:
+            # detach from the server's terminal, so that things like
+            # ^C on the server don't end up in the sessions
+            os.setsid()
+
+            conn.setblocking(True)
+            for fd in (0, 1, 2):
+                os.dup2(conn.fileno(), fd)
+            conn.close()
+
+            self.interpreter.interact(None, self.name, pause=self.pause,
+                                      interactive=self.interactive,
+                                      start_at=self.start_at,
+                                      precheck=False)
+        except SystemExit as ex:
+            status = ex.code if isinstance(ex.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                # don't run any of the server's cleanup
+                os._exit(status)
+
+    def _accept(self, conn):
+        if len(self.sessions) >= self.max_sessions:
+            try:
+                conn.sendall(b'Sorry, too many people are using this '
+                             b'tutorial right now.  Please try again '
+                             b'later.\n')
+            finally:
+                conn.close()
+
+            return
+
+        # anything still buffered would get written by both processes
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            self._sock.close()
+            self._run_session(conn)
+
+        conn.close()
+        self.sessions.add(pid)
+        self.log.write('session {0} started ({1} active)\n'.format(
+            pid, len(self.sessions)))
+
+    def serve_forever(self):
+        self._prepare()
+        own_env = self.interpreter.start_env()
+
+        try:
+            self._listen()
+            self.log.write('Serving {0} on {1}\n'.format(self.name,
+                                                         self.address))
+
+            while True:
+                self._reap()
+                try:
+                    conn, _ = self._sock.accept()
+                except socket.timeout:
+                    continue
+                except socket.error as ex:
+                    if ex.errno == errno.EINTR:
+                        continue
+                    raise
+
+                self._accept(conn)
+        finally:
+            self.shutdown()
+            if own_env:
+                self.interpreter.stop_env()
+
+    def shutdown(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+            if not isinstance(self.address, tuple):
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
+
+        for pid in list(self.sessions):
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+        self.sessions.clear()
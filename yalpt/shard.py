@@ -0,0 +1,220 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import hashlib
+import re
+
+import six
+
+
+__all__ = ["plan", "parse_shard", "run_shard", "merge_reports",
+           "setup_chunks", "ShardError"]
+
+
+class ShardError(ValueError):
+    pass
+
+
+SETUP_RE = re.compile(r'#\s*yalpt:\s*setup\b')
+
+REPLAY_MODES = ('auto', 'all', 'setup')
+
+
+def setup_chunks(store):
+    # Code chunks marked with a "# yalpt: setup" comment just set up state,
+    # so they're all a shard needs to replay to get going.  A marker applies
+    # to its whole code block (every code chunk between the surrounding
+    # text), since the doctest parser makes each ">>>" line its own chunk.
+    # Returns the set of the indices of those chunks.
+    res = set()
+    block = []
+    marked = False
+    for chunk_ind in six.moves.range(len(store) + 1):
+        if chunk_ind < len(store) and store.is_code(chunk_ind):
+            block.append(chunk_ind)
+            if SETUP_RE.search(store[chunk_ind].source) is not None:
+                marked = True
+        elif chunk_ind == len(store) or store[chunk_ind].strip():
+            if marked:
+                res.update(block)
+            block = []
+            marked = False
+
+    return res
+
+
+def parse_shard(spec):
+    # 'I/N' (1-based) --> (I, N)
+    index, sep, count = spec.partition('/')
+    if not sep or not index.isdigit() or not count.isdigit():
+        raise ShardError("shard must be given as I/N, not {0!r}".format(spec))
+
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise ShardError("shard {0}/{1} is out of range".format(index, count))
+
+    return (index, count)
+
+
+def plan(store, count):
+    # Split a ChunkStore into count contiguous [start, end) ranges with
+    # roughly the same number of code chunks each.  Shards only ever start
+    # at a non-empty text chunk, so code chunks which follow one another
+    # directly (and so probably belong together) stay in the same shard.
+    # The result depends only on the document, so every shard computes the
+    # same plan.  If there aren't enough places to split, the trailing
+    # shards are empty.
+    code_before = []
+    boundaries = []
+    num_code = 0
+    for chunk_ind in six.moves.range(len(store)):
+        if store.is_code(chunk_ind):
+            num_code += 1
+        elif chunk_ind > 0 and store[chunk_ind].strip():
+            boundaries.append(chunk_ind)
+            code_before.append(num_code)
+
+    starts = [0]
+    cand = 0
+    for shard_ind in six.moves.range(1, count):
+        target = float(num_code * shard_ind) / count
+
+        # boundaries are sorted, so walk forward while that gets us closer
+        while (cand + 1 < len(boundaries) and
+               abs(code_before[cand + 1] - target) <
+               abs(code_before[cand] - target)):
+            cand += 1
+
+        if cand < len(boundaries) and boundaries[cand] > starts[-1]:
+            starts.append(boundaries[cand])
+            cand += 1
+        else:
+            starts.append(len(store))
+
+    ends = starts[1:] + [len(store)]
+    return list(zip(starts, ends))
+
+
+def run_shard(interpreter, lit_string, name, index, count, replay='auto'):
+    # Run just the index-th (1-based) of count shards of a document, and
+    # return a JSON-friendly report of the results.  The state left by
+    # earlier shards is rebuilt by silently replaying their code chunks
+    # first -- either all of them, or just the ones marked as setup code
+    # (see setup_chunks -- 'auto' means the latter if the document has any
+    # markers).
+    if replay not in REPLAY_MODES:
+        raise ShardError("unknown replay mode {0!r}".format(replay))
+
+    interpreter.load(lit_string, name)
+    store = interpreter.chunks
+    start, end = plan(store, count)[index - 1]
+
+    setup = setup_chunks(store)
+    if replay == 'auto':
+        replay = 'setup' if setup else 'all'
+
+    problems = []
+    for chunk_ind in six.moves.range(start, end):
+        if store.is_code(chunk_ind):
+            problem = interpreter._check_chunk(store[chunk_ind], chunk_ind)
+            if problem is not None:
+                problems.append(problem)
+
+    own_env = interpreter.start_env()
+    try:
+        if replay == 'setup':
+            chunk_filter = setup.__contains__
+        else:
+            chunk_filter = None
+
+        replayed, replay_errors = interpreter.replay(0, start, chunk_filter)
+
+        if start < end:
+            interpreter.interact(None, name, pause=False, interactive=False,
+                                 start_at=start, stop_at=end,
+                                 precheck=False, console=False)
+    finally:
+        if own_env:
+            interpreter.stop_env()
+
+    results = [{'chunk': chunk_ind, 'lineno': lineno, 'status': status}
+               for chunk_ind, lineno, status in interpreter.results]
+    passed = not problems and all(res['status'] in ('pass', 'ok')
+                                  for res in results)
+
+    return {'name': name,
+            'document': hashlib.sha1(lit_string.encode('utf-8')).hexdigest(),
+            'shard': index,
+            'shards': count,
+            'chunks': [start, end],
+            'total_chunks': len(store),
+            'replay': replay,
+            'replayed': replayed,
+            'replay_errors': replay_errors,
+            'problems': [list(problem) for problem in problems],
+            'results': results,
+            'passed': passed}
+
+
+def merge_reports(reports):
+    # Combine the reports from every shard of a document into a single
+    # report.  Besides the shards' own results, this makes sure that the
+    # reports are all for the same version of the same document, and that
+    # together they cover every chunk exactly once.
+    if not reports:
+        raise ShardError("no shard reports to merge")
+
+    first = reports[0]
+    for report in reports[1:]:
+        for key in ('name', 'document', 'shards', 'total_chunks'):
+            if report[key] != first[key]:
+                raise ShardError("shard reports disagree on {0} ({1!r} vs "
+                                 "{2!r})".format(key, first[key],
+                                                 report[key]))
+
+    by_index = {}
+    for report in reports:
+        if report['shard'] in by_index:
+            raise ShardError("got more than one report for shard "
+                             "{0}".format(report['shard']))
+        by_index[report['shard']] = report
+
+    count = first['shards']
+    missing = [ind for ind in six.moves.range(1, count + 1)
+               if ind not in by_index]
+    if missing:
+        raise ShardError("missing reports for shard(s) {0}".format(
+            ', '.join(str(ind) for ind in missing)))
+
+    pos = 0
+    for ind in six.moves.range(1, count + 1):
+        start, end = by_index[ind]['chunks']
+        if start != pos:
+            raise ShardError("shard {0} starts at chunk {1}, but the "
+                             "previous one ended at chunk {2}".format(
+                                 ind, start, pos))
+        pos = end
+
+    if pos != first['total_chunks']:
+        raise ShardError("the shards only cover {0} of {1} "
+                         "chunks".format(pos, first['total_chunks']))
+
+    problems = []
+    results = []
+    statuses = {}
+    replay_errors = 0
+    for ind in six.moves.range(1, count + 1):
+        report = by_index[ind]
+        problems.extend(report['problems'])
+        results.extend(report['results'])
+        replay_errors += report['replay_errors']
+        for res in report['results']:
+            statuses[res['status']] = statuses.get(res['status'], 0) + 1
+
+    return {'name': first['name'],
+            'document': first['document'],
+            'shards': count,
+            'total_chunks': first['total_chunks'],
+            'replay_errors': replay_errors,
+            'problems': problems,
+            'results': results,
+            'statuses': statuses,
+            'passed': all(report['passed'] for report in reports)}
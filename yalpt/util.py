@@ -0,0 +1,33 @@
+# Copyright 2014, Solly Ross (see LICENSE.txt)
+import sys
+import time
+import traceback
+
+
+__all__ = ["clock", "format_traceback"]
+
+
+# for measuring durations (time.monotonic is Python 3 only)
+clock = getattr(time, 'monotonic', time.time)
+
+
+def format_traceback():
+    # Format the exception currently being handled the way the interactive
+    # interpreter does (leaving out the first frame, which belongs to the
+    # interpreter itself), and record it in sys.last_*.  Returns the whole
+    # traceback, and just its last ("ExcType: message") part.
+    try:
+        extype, value, tb = sys.exc_info()
+        sys.last_type = extype
+        sys.last_value = value
+        sys.last_traceback = tb
+        tblist = traceback.extract_tb(tb)
+        del tblist[:1]
+        lst = traceback.format_list(tblist)
+        if lst:
+            lst.insert(0, "Traceback (most recent call last):\n")
+        exc_msg = ''.join(traceback.format_exception_only(extype, value))
+    finally:
+        tblist = tb = None
+
+    return (''.join(lst) + exc_msg, exc_msg)